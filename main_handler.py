@@ -15,12 +15,22 @@ CORS   = {
     'Access-Control-Allow-Methods': 'POST, OPTIONS',
 }
 
+# Constant responses — serialised once per container, not per request
+PREFLIGHT_RESPONSE     = {'statusCode': 200, 'headers': CORS, 'body': ''}
+INVALID_JSON_RESPONSE  = {'statusCode': 400, 'headers': CORS,
+                          'body': json.dumps({'error': 'Invalid JSON'})}
+MISSING_FIELD_RESPONSE = {'statusCode': 400, 'headers': CORS,
+                          'body': json.dumps({'error': 'user_id, filename, doc_id all required'})}
+
+# transform builds its clients lazily — warm them during Lambda INIT
+transform.warm()
+
 
 def lambda_handler(event, context):
     # ── CORS preflight ─────────────────────────────────────────────────────────
     method = event.get('requestContext', {}).get('http', {}).get('method', '')
     if method == 'OPTIONS':
-        return {'statusCode': 200, 'headers': CORS, 'body': ''}
+        return PREFLIGHT_RESPONSE
 
     try:
         body     = json.loads(event.get('body', '{}'))
@@ -28,12 +38,10 @@ def lambda_handler(event, context):
         filename = body.get('filename')
         doc_id   = body.get('doc_id')
     except Exception:
-        return {'statusCode': 400, 'headers': CORS,
-                'body': json.dumps({'error': 'Invalid JSON'})}
+        return INVALID_JSON_RESPONSE
 
     if not all([user_id, filename, doc_id]):
-        return {'statusCode': 400, 'headers': CORS,
-                'body': json.dumps({'error': 'user_id, filename, doc_id all required'})}
+        return MISSING_FIELD_RESPONSE
 
     try:
         result = transform.run(user_id, filename, doc_id)
@@ -1,7 +1,8 @@
 
 
-import boto3, pdfplumber, io, re, os, json, unicodedata, logging
+import boto3, io, re, os, json, unicodedata, logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -44,6 +45,7 @@ USE_HAIKU       = os.environ.get("USE_HAIKU",     "false").lower() == "true"
 HAIKU_THRESHOLD = int(os.environ.get("HAIKU_THRESHOLD", "35"))
 HAIKU_MAX_CHARS = int(os.environ.get("HAIKU_MAX_CHARS",  "2000"))
 HAIKU_MODEL     = "anthropic.claude-3-haiku-20240307-v1:0"
+OCR_WORKERS     = int(os.environ.get("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))  # tesseract pages in parallel
 IMAGE_EXTS      = {".png", ".jpg", ".jpeg", ".tiff", ".tif", ".bmp", ".webp"}
 DOC_EXTS        = {".pdf", ".pptx", ".ppt", ".docx", ".doc"} | IMAGE_EXTS
 
@@ -51,6 +53,7 @@ DOC_EXTS        = {".pdf", ".pptx", ".ppt", ".docx", ".doc"} | IMAGE_EXTS
 def _pdf_digital(b):
     parts, found = [], 0
     try:
+        import pdfplumber   # heavy (pdfminer + Pillow) — only PDFs pay for it, like the other extractors
         with pdfplumber.open(io.BytesIO(b)) as pdf:
             for p in pdf.pages:
                 t = p.extract_text()
@@ -62,13 +65,26 @@ def _pdf_digital(b):
 def _pdf_tesseract(b):
     if not USE_TESSERACT or IS_LAMBDA: return ""
     try:
-        import pytesseract; from pdf2image import convert_from_bytes
+        import pytesseract, tempfile; from pdf2image import convert_from_path, pdfinfo_from_path
         pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
-        pages = []
-        for i, img in enumerate(convert_from_bytes(b, dpi=200)):
-            t = pytesseract.image_to_string(img, config="--oem 3 --psm 3 -l eng")
-            if t.strip(): pages.append(t)
-        return "\n".join(pages)
+        # tesseract is multi-threaded (OpenMP) by default — with OCR_WORKERS pages in
+        # flight that oversubscribes the CPUs, so cap each process at one thread
+        # unless the environment already sets a limit
+        if OCR_WORKERS > 1: os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        # pdf2image copies bytes input to a new temp file on every call — write the
+        # PDF once and render every page from that path.
+        # delete=False: Windows can't reopen a NamedTemporaryFile that is still open.
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f: f.write(b)
+        try:
+            # Render one page per task — at most OCR_WORKERS 200-dpi bitmaps in memory.
+            # pdftoppm and tesseract are subprocesses, so threads run them truly in parallel.
+            def page(n):
+                img = convert_from_path(f.name, dpi=200, first_page=n, last_page=n)[0]
+                return pytesseract.image_to_string(img, config="--oem 3 --psm 3 -l eng")
+            with ThreadPoolExecutor(max_workers=OCR_WORKERS) as pool:
+                pages = pool.map(page, range(1, pdfinfo_from_path(f.name)["Pages"] + 1))
+                return "\n".join(t for t in pages if t.strip())
+        finally: os.remove(f.name)
     except Exception as e: logger.warning(f"PDF tesseract: {e}"); return ""
 
 # ── PPTX ─────────────────────────────────────────────────────────────────────
@@ -79,13 +95,16 @@ def _pptx_native(b):
         slides = []
         for i, slide in enumerate(prs.slides):
             parts = []
-            if slide.shapes.title and slide.shapes.title.text.strip():
-                parts.append(f"## {slide.shapes.title.text.strip()}")
+            # shapes.title walks the shape tree on every access — resolve it once per slide
+            title = slide.shapes.title
+            title_text = title.text.strip() if title is not None else ""
+            if title_text:
+                parts.append(f"## {title_text}")
             for shape in slide.shapes:
                 if shape.has_text_frame:
                     for para in shape.text_frame.paragraphs:
                         line = " ".join(r.text for r in para.runs).strip()
-                        if line and line != getattr(slide.shapes.title, "text", "").strip():
+                        if line and line != title_text:
                             parts.append(line)
                 if shape.has_table:
                     for row in shape.table.rows:
@@ -126,7 +145,9 @@ def _image_tesseract(b):
     try:
         import pytesseract; from PIL import Image
         pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
-        img = Image.open(io.BytesIO(b)).convert("RGB")
+        img = Image.open(io.BytesIO(b))
+        # Tesseract reads RGB and greyscale as-is — only convert palette/alpha/CMYK etc.
+        if img.mode not in ("RGB", "L"): img = img.convert("RGB")
         return pytesseract.image_to_string(img, config="--oem 3 --psm 3 -l eng")
     except Exception as e: logger.warning(f"Image tesseract: {e}"); return ""
 
@@ -141,14 +162,20 @@ def _textract_s3(bucket, key):
     except Exception as e: logger.error(f"Textract: {e}"); return ""
 
 # ── Quality & cleanup ────────────────────────────────────────────────────────
+_OK_SINGLES = frozenset(("a","I","-","•"))   # single-char tokens that are not OCR noise
+_NON_ASCII  = re.compile(r"[^\x00-\x7F]")   # C-level scan; only these need a category lookup
+_TEXT_CATS  = frozenset(("Ll","Lu","Lt","Lo","Nd"))   # letters/digits — not garbage
 def _quality_score(text):
     if not text or len(text) < 50: return 0
     words = text.split(); tw = max(len(words), 1); tc = max(len(text), 1)
-    gc = sum(1 for c in text if ord(c)>127 and
-             unicodedata.category(c) not in ("Ll","Lu","Lt","Lo","Nd"))
-    nt = sum(1 for w in words if len(w)==1 and w not in ("a","I","-","•"))
+    gc = sum(1 for c in _NON_ASCII.findall(text)
+             if unicodedata.category(c) not in _TEXT_CATS)
+    nt = wl = 0
+    for w in words:   # one pass: stray single chars + total word length
+        n = len(w); wl += n
+        if n==1 and w not in _OK_SINGLES: nt += 1
     s  = 100 - min(40, int(gc/tc*400)) - min(30, int(nt/tw*300))
-    s -= 10 if (sum(len(w) for w in words)/tw) < 3.0 else 0
+    s -= 10 if (wl/tw) < 3.0 else 0
     return max(0, min(100, s))
 
 _FIXES = [(re.compile(p), r) for p, r in [
@@ -157,32 +184,56 @@ _FIXES = [(re.compile(p), r) for p, r in [
     (r"\bvv\b", "w"), (r"rn(?=[aeiou])", "m"),
     (r"(?<=\w)- (?=\w)", ""), (r" {2,}", " "),
 ]]
+_NOISE_LINE = re.compile(r"\d{1,4}|[\-\._ =|*~]{3,}")   # lone page number or rule line
 def _clean(text):
     out = []
     for line in text.split("\n"):
         s = line.strip()
-        if not s: out.append(""); continue
-        if re.fullmatch(r"\d{1,4}", s): continue
-        if re.fullmatch(r"[\-\._ =|*~]{3,}", s): continue
-        if len(s.split()) < 3 and not (s.isupper() or s.istitle() or s.endswith(":")): continue
-        for p, r in _FIXES: s = p.sub(r, s)
-        out.append(unicodedata.normalize("NFKC", s))
-    return re.sub(r"\n{3,}", "\n\n", "\n".join(out)).strip()
+        if not s:
+            if out and out[-1]: out.append("")   # one blank between paragraphs, none leading
+            continue
+        if _NOISE_LINE.fullmatch(s): continue
+        # maxsplit=2: only need to know whether there are 3 words, not split the whole line
+        if len(s.split(None, 2)) < 3 and not (s.isupper() or s.istitle() or s.endswith(":")): continue
+        out.append(s)
+    # None of the fixes can match across a newline, so run each once over the
+    # kept lines instead of once per line
+    text = "\n".join(out)
+    for p, r in _FIXES: text = p.sub(r, text)
+    return unicodedata.normalize("NFKC", text).strip()
 
 def _haiku_cleanup(text):
-    if not USE_HAIKU: return text
-    if _quality_score(text) >= HAIKU_THRESHOLD: return text
     logger.info("[OCR] Haiku cleanup (1 call, capped)...")
+    # Cap on the last line/word break before the limit so no word is split
+    # between the cleaned head and the untouched tail
+    cut = len(text)
+    if cut > HAIKU_MAX_CHARS:
+        cut = max(text.rfind("\n", 0, HAIKU_MAX_CHARS), text.rfind(" ", 0, HAIKU_MAX_CHARS))
+        if cut <= 0: cut = HAIKU_MAX_CHARS
     try:
         body = json.dumps({"anthropic_version":"bedrock-2023-05-31","max_tokens":512,
             "messages":[{"role":"user","content":
-                f"Fix OCR errors. Keep all content. Output clean text ONLY.\n\n{text[:HAIKU_MAX_CHARS]}"}]})
+                f"Fix OCR errors. Keep all content. Output clean text ONLY.\n\n{text[:cut]}"}]})
         resp = _get_bedrock().invoke_model(modelId=HAIKU_MODEL,
             contentType="application/json", accept="application/json", body=body)
         cleaned = json.loads(resp["body"].read())["content"][0]["text"]
-        return (cleaned + ("\n"+text[HAIKU_MAX_CHARS:] if len(text)>HAIKU_MAX_CHARS else "")).strip()
+        return (cleaned + ("\n"+text[cut:].lstrip() if cut < len(text) else "")).strip()
     except Exception as e: logger.warning(f"Haiku: {e}"); return text
 
+def _pdf_native(b):
+    text, found = _pdf_digital(b)
+    if found == 0 or len(text.strip()) < 150:
+        text = _pdf_tesseract(b)
+    return text
+
+# ext → (local extractor, min chars before falling back to Textract)
+_EXTRACTORS = {
+    ".pdf":  (_pdf_native,  150),
+    ".pptx": (_pptx_native, 100), ".ppt": (_pptx_native, 100),
+    ".docx": (_docx_native,  50), ".doc": (_docx_native,  50),
+    **{e: (_image_tesseract, 30) for e in IMAGE_EXTS},
+}
+
 # ── PUBLIC API ────────────────────────────────────────────────────────────────
 def extract_text(bucket: str, key: str) -> str:
     """Called by main_handler.py: text = ocr.extract_text(BUCKET, f'uploads/{filename}')"""
@@ -193,33 +244,20 @@ def extract_text(bucket: str, key: str) -> str:
     logger.info(f"[OCR] START {ext} | s3://{bucket}/{key}")
     b = _get_s3().get_object(Bucket=bucket, Key=key)["Body"].read()
 
-    if ext == ".pdf":
-        text, found = _pdf_digital(b)
-        if found == 0 or len(text.strip()) < 150:
-            text = _pdf_tesseract(b)
-        if len(text.strip()) < 150:
-            text = _textract_s3(bucket, key)
-
-    elif ext in (".pptx", ".ppt"):
-        text = _pptx_native(b)
-        if len(text.strip()) < 100:
-            text = _textract_s3(bucket, key)
-
-    elif ext in (".docx", ".doc"):
-        text = _docx_native(b)
-        if len(text.strip()) < 50:
-            text = _textract_s3(bucket, key)
-
-    elif ext in IMAGE_EXTS:
-        text = _image_tesseract(b)
-        if len(text.strip()) < 30:
-            text = _textract_s3(bucket, key)
+    extractor, min_chars = _EXTRACTORS[ext]
+    text = extractor(b)
+    if len(text.strip()) < min_chars:
+        text = _textract_s3(bucket, key)
 
     if not text.strip():
         raise ValueError(f"No text found in s3://{bucket}/{key}")
 
-    text = _clean(text)
-    text = _haiku_cleanup(text)
+    text  = _clean(text)
+    # Score once; rescore only if Haiku rewrote the text
+    score = _quality_score(text)
+    if USE_HAIKU and score < HAIKU_THRESHOLD:
+        text  = _haiku_cleanup(text)
+        score = _quality_score(text)
 
-    logger.info(f"[OCR] DONE: {len(text):,} chars | quality={_quality_score(text)}/100")
+    logger.info(f"[OCR] DONE: {len(text):,} chars | quality={score}/100")
     return text
\ No newline at end of file
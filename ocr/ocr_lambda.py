@@ -21,6 +21,15 @@ s3     = boto3.client('s3', region_name=os.environ.get('AWS_DEFAULT_REGION', 'us
 BUCKET = os.environ.get('BUCKET_NAME', 'akte-bucket')
 
 
+def _already_extracted(output_key, etag):
+    try:
+        head = s3.head_object(Bucket=BUCKET, Key=output_key)
+    except Exception:
+        return False
+    # Empty failure markers carry no source-etag, so failed uploads are always retried
+    return head.get('ContentLength', 0) > 0 and head.get('Metadata', {}).get('source-etag') == etag
+
+
 def lambda_handler(event, context):
     """
     S3 PUT trigger. Called automatically when a file lands in uploads/.
@@ -39,6 +48,13 @@ def lambda_handler(event, context):
         user_id  = parts[1]
         filename = '/'.join(parts[2:])
         output_key = f'extracted/{user_id}/{filename}.txt'
+        etag       = record['s3']['object'].get('eTag', '')
+
+        # Re-uploading the same bytes fires the trigger again — skip the OCR if
+        # the existing output was extracted from an object with this exact ETag
+        if etag and _already_extracted(output_key, etag):
+            logger.info(f'[OCR Lambda] unchanged upload, keeping s3://{BUCKET}/{output_key}')
+            continue
 
         try:
             text = extract_text(BUCKET, s3_key)
@@ -48,7 +64,8 @@ def lambda_handler(event, context):
                 Bucket=BUCKET,
                 Key=output_key,
                 Body=text.encode('utf-8'),
-                ContentType='text/plain; charset=utf-8'
+                ContentType='text/plain; charset=utf-8',
+                Metadata={'source-etag': etag}
             )
             logger.info(f'[OCR Lambda] saved to s3://{BUCKET}/{output_key}')
 
@@ -2,6 +2,8 @@ import boto3
 import json
 import re
 import os
+import time
+from collections import OrderedDict
 from botocore.exceptions import ClientError
 from datetime import datetime, timezone
 
@@ -15,11 +17,24 @@ CORS         = {
 }
 VALID_LEVELS = {'beginner', 'intermediate', 'expert'}
 
+USER_ID_PATTERN = re.compile(r'^[a-zA-Z0-9\-]{1,64}$')
+DOC_ID_PATTERN  = re.compile(r'^[a-zA-Z0-9\-_\.#]{1,256}$')
+
+users_table = dynamodb.Table(TABLE)   # built once per container, reused across warm invocations
+
+# Opt-in warm-container cache for get_level: (user_id, doc_id) → (stored_at, result).
+# set_level only drops the entry in its own container, so a get_level served by
+# another warm container can return the old level for up to the TTL. Off by
+# default; if enabled, keep it well below a user's set-then-read cycle (a few seconds).
+LEVEL_CACHE_TTL  = float(os.environ.get('LEVEL_CACHE_TTL', '0'))   # seconds, 0 disables
+LEVEL_CACHE_SIZE = 1024
+_level_cache     = OrderedDict()
+
 
 def _validate_user_id(user_id):
     if not user_id or not isinstance(user_id, str):
         raise ValueError("user_id must be a non-empty string")
-    if not re.match(r'^[a-zA-Z0-9\-]{1,64}$', user_id.strip()):
+    if not USER_ID_PATTERN.match(user_id.strip()):
         raise ValueError("user_id contains invalid characters")
     return user_id.strip()
 
@@ -28,7 +43,7 @@ def _validate_doc_id(doc_id):
     if not doc_id or not isinstance(doc_id, str):
         raise ValueError("doc_id must be a non-empty string")
     doc_id = doc_id.strip()
-    if not re.match(r'^[a-zA-Z0-9\-_\.#]{1,256}$', doc_id):
+    if not DOC_ID_PATTERN.match(doc_id):
         raise ValueError("doc_id contains invalid characters")
     if len(doc_id.split('#')) != 3:
         raise ValueError("doc_id format invalid — expected user_id#filename#timestamp")
@@ -36,12 +51,22 @@ def _validate_doc_id(doc_id):
 
 
 def _get_level(user_id, doc_id):
-    table    = dynamodb.Table(TABLE)
-    response = table.get_item(Key={'user_id': user_id, 'doc_id': doc_id})
+    key    = (user_id, doc_id)
+    cached = _level_cache.get(key)
+    if cached and time.monotonic() - cached[0] < LEVEL_CACHE_TTL:
+        _level_cache.move_to_end(key)
+        return cached[1]
+
+    response = users_table.get_item(
+        Key={'user_id': user_id, 'doc_id': doc_id},
+        # Only the fields returned below — skips annotations/self_answers
+        ProjectionExpression='user_id, doc_id, #lvl, filename, quiz_score, created_at',
+        ExpressionAttributeNames={'#lvl': 'level'},
+    )
     item     = response.get('Item')
     if not item:
         raise KeyError(f"No document found for doc_id '{doc_id}'")
-    return {
+    result = {
         'user_id':    item.get('user_id'),
         'doc_id':     item.get('doc_id'),
         'level':      item.get('level', 'beginner'),
@@ -49,13 +74,18 @@ def _get_level(user_id, doc_id):
         'quiz_score': item.get('quiz_score'),
         'created_at': item.get('created_at'),
     }
+    if LEVEL_CACHE_TTL > 0:
+        _level_cache[key] = (time.monotonic(), result)
+        _level_cache.move_to_end(key)
+        while len(_level_cache) > LEVEL_CACHE_SIZE:
+            _level_cache.popitem(last=False)
+    return result
 
 
 def _set_level(user_id, doc_id, level):
-    table   = dynamodb.Table(TABLE)
     now_iso = datetime.now(timezone.utc).isoformat()
     try:
-        response = table.update_item(
+        response = users_table.update_item(
             Key={'user_id': user_id, 'doc_id': doc_id},
             UpdateExpression='SET #lvl = :level, updated_at = :now',
             ExpressionAttributeNames={'#lvl': 'level'},
@@ -67,6 +97,7 @@ def _set_level(user_id, doc_id, level):
         if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
             raise KeyError(f"No document found for doc_id '{doc_id}'")
         raise
+    _level_cache.pop((user_id, doc_id), None)
     updated = response.get('Attributes', {})
     return {
         'user_id':    updated.get('user_id'),
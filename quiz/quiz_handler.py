@@ -2,7 +2,8 @@ import boto3
 import json
 from botocore.exceptions import ClientError
 from datetime import datetime, timezone
-from boto3.dynamodb.conditions import Key
+from itertools import chain
+from boto3.dynamodb.conditions import Key, Attr
 import os
 
 # ── AWS clients ────────────────────────────────────────────────────────────────
@@ -24,6 +25,11 @@ TARGET_WORDS              = 1500
 MIN_WORDS_FOR_MCQ         = 150
 RATE_LIMIT_WINDOW_SECONDS = 60
 
+users_table = dynamodb.Table(TABLE)   # built once per container, reused across warm invocations
+
+# '#' delimits doc_id fields — mapped to '-' together with path separators in one pass
+DOC_ID_UNSAFE_CHARS = str.maketrans('/\\#', '---')
+
 
 class UnreadableDocumentError(Exception):
     pass
@@ -69,23 +75,28 @@ BACKGROUND_TO_LEVEL = {
     "deep":    "expert"
 }
 
+LEVEL_ORDER = ('beginner', 'intermediate', 'expert')
+LEVEL_INDEX = {level: i for i, level in enumerate(LEVEL_ORDER)}
+LOW_BACKGROUND = frozenset(('none', 'some'))
+# MCQ scores that sit on a level boundary, where self-assessment can pull down
+BOUNDARY_SCORES_5 = frozenset((2, 4))
+BOUNDARY_SCORES_3 = frozenset((1, 2))
+
 
 def _make_doc_id(user_id, filename):
     timestamp     = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
-    safe_filename = filename.replace('/', '-').replace('\\', '-').replace('#', '-')
+    safe_filename = filename.translate(DOC_ID_UNSAFE_CHARS)
     return f"{user_id}#{safe_filename}#{timestamp}"
 
 
 def _check_rate_limit(user_id):
-    from boto3.dynamodb.conditions import Attr
-    table      = dynamodb.Table(TABLE)
     now        = datetime.now(timezone.utc)
     now_iso    = now.isoformat()
     rate_key   = 'rate_limit'
     cutoff     = now.timestamp() - RATE_LIMIT_WINDOW_SECONDS
     cutoff_iso = datetime.fromtimestamp(cutoff, tz=timezone.utc).isoformat()
     try:
-        table.put_item(
+        users_table.put_item(
             Item={'user_id': user_id, 'doc_id': rate_key, 'last_generate_at': now_iso},
             ConditionExpression=(
                 Attr('user_id').not_exists() | Attr('last_generate_at').lte(cutoff_iso)
@@ -94,7 +105,7 @@ def _check_rate_limit(user_id):
     except ClientError as e:
         if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
             try:
-                resp      = table.get_item(Key={'user_id': user_id, 'doc_id': rate_key})
+                resp      = users_table.get_item(Key={'user_id': user_id, 'doc_id': rate_key})
                 item      = resp.get('Item', {})
                 last_call = datetime.fromisoformat(item.get('last_generate_at', now_iso))
                 if last_call.tzinfo is None:
@@ -155,12 +166,12 @@ def _generate_questions(preview_text, word_count):
     })
     resp = bedrock.invoke_model(modelId=MODEL, body=body)
     raw  = json.loads(resp['body'].read())['output']['message']['content'][0]['text'].strip()
-    if raw.startswith('```'):
-        parts = raw.split('```')
-        raw   = parts[1] if len(parts) > 1 else raw
-        if raw.lower().startswith('json'):
-            raw = raw[4:]
-    return json.loads(raw.strip())
+    # Any ```json fence or preamble sits before the array — decode from the first
+    # '[' and ignore whatever follows it (closing fence, trailing notes)
+    start = raw.find('[')
+    if start != -1:
+        return json.JSONDecoder().raw_decode(raw, start)[0]
+    return json.loads(raw)
 
 
 def _score_and_level(questions, mcq_answers, background_answer):
@@ -173,31 +184,30 @@ def _score_and_level(questions, mcq_answers, background_answer):
         if mcq_score <= 1:   mcq_level = 'beginner'
         elif mcq_score <= 3: mcq_level = 'intermediate'
         else:                mcq_level = 'expert'
-        boundary_scores = {2, 4}
+        boundary_scores = BOUNDARY_SCORES_5
     else:
         if mcq_score == 0:   mcq_level = 'beginner'
         elif mcq_score <= 2: mcq_level = 'intermediate'
         else:                mcq_level = 'expert'
-        boundary_scores = {1, 2}
+        boundary_scores = BOUNDARY_SCORES_3
 
-    level_order = ['beginner', 'intermediate', 'expert']
     final_level = mcq_level
-    low_background = background_answer in ('none', 'some')
-    if low_background and mcq_level == 'expert':
+    if background_answer in LOW_BACKGROUND and mcq_level == 'expert':
         final_level = 'intermediate'
     else:
         if mcq_score in boundary_scores:
             self_level = BACKGROUND_TO_LEVEL.get(background_answer, 'beginner')
-            mcq_idx    = level_order.index(mcq_level)
-            self_idx   = level_order.index(self_level)
+            mcq_idx    = LEVEL_INDEX[mcq_level]
+            self_idx   = LEVEL_INDEX[self_level]
             if self_idx < mcq_idx:
-                final_level = level_order[mcq_idx - 1]
+                final_level = LEVEL_ORDER[mcq_idx - 1]
     return mcq_score, final_level
 
 
 def _save_profile(user_id, doc_id, filename, level, mcq_score,
                   self_answers, word_count, extraction_note):
-    dynamodb.Table(TABLE).put_item(Item={
+    now_iso = datetime.now(timezone.utc).isoformat()
+    users_table.put_item(Item={
         'user_id':           user_id,
         'doc_id':            doc_id,
         'filename':          filename,
@@ -211,24 +221,27 @@ def _save_profile(user_id, doc_id, filename, level, mcq_score,
         'word_count':        word_count,
         'extraction_note':   extraction_note,
         'transform_status':  'pending',
-        'created_at':        datetime.now(timezone.utc).isoformat(),
-        'updated_at':        datetime.now(timezone.utc).isoformat()
+        'created_at':        now_iso,
+        'updated_at':        now_iso
     })
 
 
+def _query_pages(user_id):
+    kwargs = {'KeyConditionExpression': Key('user_id').eq(user_id)}
+    while True:
+        response = users_table.query(**kwargs)
+        yield response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
 def _get_history(user_id):
-    table    = dynamodb.Table(TABLE)
-    response = table.query(KeyConditionExpression=Key('user_id').eq(user_id))
-    items    = response.get('Items', [])
-    while 'LastEvaluatedKey' in response:
-        response = table.query(
-            KeyConditionExpression=Key('user_id').eq(user_id),
-            ExclusiveStartKey=response['LastEvaluatedKey']
-        )
-        items.extend(response.get('Items', []))
-    items = [i for i in items if i.get('doc_id') != 'rate_limit']
-    items.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    return items
+    items = chain.from_iterable(_query_pages(user_id))
+    return sorted(
+        (i for i in items if i.get('doc_id') != 'rate_limit'),
+        key=lambda x: x.get('created_at', ''), reverse=True
+    )
 
 
 def lambda_handler(event, context):
@@ -21,14 +21,19 @@ ALLOWED_EXTENSIONS = {
     '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
 }
 
-FILENAME_WHITELIST = re.compile(r'[^a-zA-Z0-9_\-\.]')
+# ' ' → '_', every other ASCII char outside [a-zA-Z0-9_-.] deleted — one C-level pass
+FILENAME_TABLE     = str.maketrans(' ', '_', ''.join(
+    c for c in map(chr, range(128)) if not (c.isalnum() or c in ' _-.')
+))
+USER_ID_PATTERN    = re.compile(r'^[a-zA-Z0-9\-]{1,64}$')
 
 
 def _sanitise_filename(filename):
     if not filename or not isinstance(filename, str):
         raise ValueError("Filename cannot be empty")
-    name = filename.strip().replace(' ', '_')
-    name = FILENAME_WHITELIST.sub('', name)
+    # Non-ASCII is dropped first so the table only has to cover ASCII
+    name = filename.strip().encode('ascii', 'ignore').decode('ascii')
+    name = name.translate(FILENAME_TABLE)
     base, ext = os.path.splitext(name)
     if ext.lower() not in ALLOWED_EXTENSIONS:
         allowed = ', '.join(ALLOWED_EXTENSIONS.keys())
@@ -44,7 +49,7 @@ def _sanitise_filename(filename):
 def _validate_user_id(user_id):
     if not user_id or not isinstance(user_id, str):
         raise ValueError("user_id must be a non-empty string")
-    if not re.match(r'^[a-zA-Z0-9\-]{1,64}$', user_id.strip()):
+    if not USER_ID_PATTERN.match(user_id.strip()):
         raise ValueError("user_id contains invalid characters")
     return user_id.strip()
 
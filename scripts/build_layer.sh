@@ -13,8 +13,16 @@ set -e
 echo "Building pdfplumber Lambda Layer..."
 rm -rf python pdfplumber_layer.zip
 
+PYTHON="${PYTHON:-python3.11}"   # must match the Lambda runtime or the .pyc files are ignored
+
 mkdir python
-pip install pdfplumber -t python/
+"$PYTHON" -m pip install pdfplumber -t python/ --no-compile
+
+# Strip what is never imported at runtime, then precompile — the layer is
+# read-only in Lambda, so bytecode has to ship in the zip (checked-hash: zip
+# rounds mtimes to 2s, which would invalidate timestamp-checked .pyc)
+find python -type d \( -name tests -o -name test -o -name __pycache__ \) -prune -exec rm -rf {} +
+"$PYTHON" -m compileall -q --invalidation-mode checked-hash python/
 
 zip -r pdfplumber_layer.zip python/
 
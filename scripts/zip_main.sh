@@ -13,6 +13,7 @@ set -e
 
 LAMBDA_DIR="backend/lambda-main"
 OUTPUT="akte_main.zip"
+PYTHON="${PYTHON:-python3.11}"   # must match the Lambda runtime or the .pyc files are ignored
 
 echo "Checking for required files..."
 
@@ -23,9 +24,18 @@ for f in main_handler.py ocr.py transform.py; do
   fi
 done
 
-echo "Zipping..."
+echo "Precompiling..."
+# /var/task is read-only, so Lambda can't write its own bytecode cache —
+# ship __pycache__ to skip compiling on every cold start. checked-hash: zip
+# keeps mtimes at 2s resolution, which would make timestamp-checked .pyc stale,
+# and a handler edited in the Lambda console still invalidates its .pyc
 cd "$LAMBDA_DIR"
-zip -j "../../$OUTPUT" main_handler.py ocr.py transform.py
+rm -rf __pycache__
+"$PYTHON" -m compileall -q --invalidation-mode checked-hash main_handler.py ocr.py transform.py
+
+echo "Zipping..."
+rm -f "../../$OUTPUT"
+zip -r "../../$OUTPUT" main_handler.py ocr.py transform.py __pycache__
 cd ../..
 
 echo "Done: $OUTPUT created."
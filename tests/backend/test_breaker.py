@@ -0,0 +1,59 @@
+# tests/backend/test_breaker.py — Person C runs this locally
+#
+# Prerequisites:
+#   pip install boto3
+#
+# Run: python3 tests/backend/test_breaker.py
+#
+# Offline — Bedrock is replaced by a fake client, no AWS calls are made.
+# What to look for:
+#   4xx errors (ValidationException etc.) never open the circuit breaker
+#   5xx errors open it after BREAKER_FAILURES calls
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../transform'))
+
+from botocore.exceptions import ClientError
+import transform
+
+
+class FakeBedrock:
+    def __init__(self, code):
+        self.code  = code
+        self.calls = 0
+
+    def invoke_model(self, modelId, body):
+        self.calls += 1
+        raise ClientError({'Error': {'Code': self.code, 'Message': 'fake'}}, 'InvokeModel')
+
+
+def hammer(code, attempts=5):
+    # Fresh breaker, then `attempts` calls that all fail with `code`
+    transform._bedrock       = FakeBedrock(code)
+    transform._breaker_fails = 0
+    transform._breaker_until = 0.0
+    for _ in range(attempts):
+        try:
+            transform._invoke('fake-model', '{}')
+        except (ClientError, transform.BedrockUnavailable):
+            pass
+    return transform._bedrock.calls
+
+
+if __name__ == '__main__':
+    ok = True
+    for code in ('ValidationException', 'AccessDeniedException', 'ResourceNotFoundException'):
+        calls = hammer(code)
+        passed = calls == 5 and transform._breaker_until == 0.0
+        ok &= passed
+        print(f"{'✓' if passed else '✗'} {code}: {calls}/5 calls reached Bedrock — breaker should stay closed")
+
+    calls = hammer('ServiceUnavailableException')
+    passed = calls == transform.BREAKER_FAILURES and transform._breaker_until > 0
+    ok &= passed
+    print(f"{'✓' if passed else '✗'} ServiceUnavailableException: {calls}/5 calls reached Bedrock "
+          f"— breaker should open after {transform.BREAKER_FAILURES}")
+
+    print("\n✓ Breaker test passed" if ok else "\n✗ Breaker test failed")
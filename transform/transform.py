@@ -5,6 +5,7 @@
 # PUBLIC API:
 #   result = transform.run(user_id, filename, doc_id)
 #   Returns: { "s3_key", "level", "intent", "annotations" }
+#   transform.warm()  — build the AWS clients ahead of the first run
 #
 # READS:  extracted/{user_id}/{filename}.txt  (OCR output)
 #         DynamoDB: level, intent  (quiz output)
@@ -14,17 +15,27 @@
 # =============================================================================
 
 import boto3
+import hashlib
 import json
 import re
 import os
 import logging
+import threading
+import time
+from botocore.config import Config
+from botocore.exceptions import (ClientError, ConnectionClosedError, ConnectTimeoutError,
+                                 EndpointConnectionError, ReadTimeoutError)
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from itertools import islice
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 # ── AWS clients ───────────────────────────────────────────────────────────────
-_s3 = _bedrock = _dynamodb = None
+_s3 = _bedrock = _dynamodb = _table = None
 
 def _get_s3():
     global _s3
@@ -35,8 +46,15 @@ def _get_s3():
 def _get_bedrock():
     global _bedrock
     if not _bedrock:
+        # Connection pool with room for every concurrent call (chunk workers + annotations);
+        # botocore's default pool is 10, so only a larger CHUNK_WORKERS raises it.
+        # Adaptive retries add a client-side token bucket that only delays calls
+        # once Bedrock starts throttling, instead of every worker retrying blind.
+        # max_attempts stays at botocore's legacy default of 5.
         _bedrock = boto3.client('bedrock-runtime',
-                                region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+                                region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+                                config=Config(max_pool_connections=max(10, CHUNK_WORKERS + 1),
+                                              retries={'mode': 'adaptive', 'max_attempts': 5}))
     return _bedrock
 
 def _get_dynamodb():
@@ -46,11 +64,29 @@ def _get_dynamodb():
                                    region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
     return _dynamodb
 
+def _get_table():
+    global _table
+    if not _table:
+        _table = _get_dynamodb().Table(TABLE)
+    return _table
+
+def warm():
+    # Call at import time from the handler so botocore's service models load
+    # during Lambda INIT rather than inside the first request
+    _get_s3()
+    _get_bedrock()
+    _get_table()
+
 BUCKET           = os.environ.get('BUCKET_NAME', 'ocr-ai-for-bharat1')
 TABLE            = os.environ.get('TABLE_NAME',  'akte-users')
 MODEL_TRANSFORM  = 'amazon.nova-lite-v1:0'                        # cheap: transform chunks
 MODEL_ANNOTATE   = 'anthropic.claude-haiku-3-5-20251001-v1:0'    # smart: one call for annotations
 CHUNK_WORDS      = 400   # smaller = Nova Lite stays focused, less likely to drift
+CHUNK_WORKERS    = int(os.environ.get('CHUNK_WORKERS', '4'))   # chunks rewritten in parallel
+
+_WORD_RE    = re.compile(r'\S+')
+_PARA_SPLIT = re.compile(r'\n\s*\n')
+_SENT_SPLIT = re.compile(r'(?<=[.!?])\s+')
 
 
 # =============================================================================
@@ -59,8 +95,10 @@ CHUNK_WORDS      = 400   # smaller = Nova Lite stays focused, less likely to dri
 # Keeps ideas whole instead of cutting mid-argument.
 # =============================================================================
 
-def _chunk(text: str) -> list:
-    paragraphs = re.split(r'\n\s*\n', text.strip())
+def _chunk(text: str) -> list[tuple[str, int]]:
+    # Returns (chunk, word_count) pairs, not bare strings — the counts fall out
+    # of the packing, so callers never need to re-split a chunk to size or log it
+    paragraphs = _PARA_SPLIT.split(text.strip())
     chunks, current_words, current_paras = [], 0, []
 
     for para in paragraphs:
@@ -70,16 +108,16 @@ def _chunk(text: str) -> list:
         wc = len(para.split())
 
         if current_words + wc > CHUNK_WORDS and current_paras:
-            chunks.append('\n\n'.join(current_paras))
+            chunks.append(('\n\n'.join(current_paras), current_words))
             current_paras, current_words = [], 0
 
         # Single oversized paragraph — split by sentences
         if wc > CHUNK_WORDS:
-            sentences = re.split(r'(?<=[.!?])\s+', para)
+            sentences = _SENT_SPLIT.split(para)
             for s in sentences:
                 sw = len(s.split())
                 if current_words + sw > CHUNK_WORDS and current_paras:
-                    chunks.append('\n\n'.join(current_paras))
+                    chunks.append(('\n\n'.join(current_paras), current_words))
                     current_paras, current_words = [], 0
                 current_paras.append(s)
                 current_words += sw
@@ -88,9 +126,11 @@ def _chunk(text: str) -> list:
             current_words += wc
 
     if current_paras:
-        chunks.append('\n\n'.join(current_paras))
+        chunks.append(('\n\n'.join(current_paras), current_words))
 
-    return [c for c in chunks if c.strip()]
+    # Every piece above is a stripped, non-empty paragraph or sentence, so no
+    # chunk can be blank — no second filtering pass needed
+    return chunks
 
 
 # =============================================================================
@@ -340,6 +380,13 @@ def _build_system_prompt(level: str, intent: str) -> str:
     return f"{SYSTEM_BASE}\n\n{level_p}\n\n{intent_p}"
 
 
+# Every known level × intent prompt is assembled once at import
+_SYSTEM_PROMPTS = {
+    (level, intent): _build_system_prompt(level, intent)
+    for level in LEVEL_PROMPTS for intent in INTENT_PROMPTS
+}
+
+
 def _build_user_message(chunk: str, chunk_num: int, total_chunks: int,
                         level: str, intent: str) -> str:
     if total_chunks > 1:
@@ -361,8 +408,89 @@ def _build_user_message(chunk: str, chunk_num: int, total_chunks: int,
 
 # =============================================================================
 # SECTION 3 — BEDROCK CALL
+# Accepted results are cached per container: a chunk rewrite once it passes
+# _valid, an annotation list once it parses. Re-transforming the same document
+# on a warm Lambda skips Bedrock, but a rejected reply is never cached, so a
+# retry still gets a fresh call.
+# After BREAKER_FAILURES consecutive errors the breaker opens and calls fail
+# fast for BREAKER_COOLDOWN seconds — callers already fall back (original
+# chunk / no annotations), so an outage costs one timeout, not one per chunk.
+# Only outages count towards opening it — 5xx codes and connection/read
+# timeouts. A 4xx (bad request, access denied, unknown model) belongs to that
+# one call and can't be fixed by waiting, and throttling is already backed off
+# by adaptive retries, so neither may lock out the rest of the container.
 # =============================================================================
 
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))   # 0 disables
+_response_cache     = OrderedDict()
+_response_lock      = threading.Lock()
+
+BREAKER_FAILURES    = 3
+BREAKER_COOLDOWN    = 60   # seconds
+_breaker_fails      = 0
+_breaker_until      = 0.0
+_breaker_lock       = threading.Lock()
+
+
+class BedrockUnavailable(RuntimeError):
+    pass
+
+
+_OUTAGE_CODES  = frozenset({'ServiceUnavailableException', 'InternalServerException',
+                            'ModelTimeoutException', 'ModelNotReadyException'})
+_OUTAGE_ERRORS = (EndpointConnectionError, ConnectTimeoutError,
+                  ReadTimeoutError, ConnectionClosedError)
+
+
+def _is_outage(e: Exception) -> bool:
+    if isinstance(e, ClientError):
+        return e.response['Error']['Code'] in _OUTAGE_CODES
+    return isinstance(e, _OUTAGE_ERRORS)
+
+
+def _cache_key(*parts) -> str:
+    return hashlib.sha256('\n'.join(map(str, parts)).encode('utf-8')).hexdigest()
+
+
+def _cache_get(key: str):
+    with _response_lock:
+        if key in _response_cache:
+            _response_cache.move_to_end(key)
+            return _response_cache[key]
+    return None
+
+
+def _cache_put(key: str, value) -> None:
+    if RESPONSE_CACHE_SIZE <= 0:
+        return
+    with _response_lock:
+        _response_cache[key] = value
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def _invoke(model_id: str, body: str) -> dict:
+    global _breaker_fails, _breaker_until
+    if time.monotonic() < _breaker_until:
+        raise BedrockUnavailable('Bedrock circuit open — skipping call')
+    try:
+        resp   = _get_bedrock().invoke_model(modelId=model_id, body=body)
+        result = json.loads(resp['body'].read())
+    except Exception as e:
+        if not _is_outage(e):
+            raise
+        with _breaker_lock:
+            _breaker_fails += 1
+            if _breaker_fails >= BREAKER_FAILURES:
+                _breaker_until = time.monotonic() + BREAKER_COOLDOWN
+                _breaker_fails = 0
+                logger.error(f'[Transform] Bedrock failing — circuit open for {BREAKER_COOLDOWN}s')
+        raise
+    with _breaker_lock:
+        _breaker_fails = 0
+    return result
+
+
 def _call_bedrock(system_prompt: str, user_message: str,
                   max_tokens: int = 2000, temperature: float = 0.65) -> str:
     # Nova Lite request format (different from Claude)
@@ -371,8 +499,7 @@ def _call_bedrock(system_prompt: str, user_message: str,
         'messages': [{'role': 'user', 'content': [{'text': user_message}]}],
         'inferenceConfig': {'maxTokens': max_tokens, 'temperature': temperature},
     })
-    resp = _get_bedrock().invoke_model(modelId=MODEL_TRANSFORM, body=body)
-    return json.loads(resp['body'].read())['output']['message']['content'][0]['text'].strip()
+    return _invoke(MODEL_TRANSFORM, body)['output']['message']['content'][0]['text'].strip()
 
 
 def _call_haiku(prompt: str, max_tokens: int = 1200) -> str:
@@ -383,26 +510,27 @@ def _call_haiku(prompt: str, max_tokens: int = 1200) -> str:
         'temperature': 0.2,
         'messages': [{'role': 'user', 'content': prompt}],
     })
-    resp = _get_bedrock().invoke_model(modelId=MODEL_ANNOTATE, body=body)
-    return json.loads(resp['body'].read())['content'][0]['text'].strip()
+    return _invoke(MODEL_ANNOTATE, body)['content'][0]['text'].strip()
 
 
 # =============================================================================
 # SECTION 4 — VALIDATION
 # =============================================================================
 
+# Model went off-task or preambled
+_BAD_PREFIXES = (
+    'I cannot', 'I apologize', 'As an AI', "I'm unable", 'I am unable',
+    'Here is', "Here's the", 'The following is', 'Below is', 'I have rewritten',
+    'Sure,', 'Certainly,',
+)
+
+
 def _valid(original: str, rewritten: str, level: str) -> bool:
-    if len(rewritten.strip()) < 50:
+    # _call_bedrock already strips the response
+    if len(rewritten) < 50:
         return False
 
-    # Model went off-task or preambled
-    bad_prefixes = [
-        'I cannot', 'I apologize', 'As an AI', "I'm unable", 'I am unable',
-        'Here is', "Here's the", 'The following is', 'Below is', 'I have rewritten',
-        'Sure,', 'Certainly,',
-    ]
-    first_80 = rewritten[:80]
-    if any(first_80.startswith(p) for p in bad_prefixes):
+    if rewritten.startswith(_BAD_PREFIXES):
         return False
 
     orig_len = len(original)
@@ -427,8 +555,13 @@ def _valid(original: str, rewritten: str, level: str) -> bool:
 # SECTION 5 — ANNOTATIONS
 # =============================================================================
 
+ANNOTATION_TYPES = frozenset({'concept', 'formula', 'person', 'definition'})
+
+
 def _generate_annotations(text: str, level: str) -> list:
-    sample = ' '.join(text.split()[:3500])
+    # Only the first 3500 words are sent — stop scanning there instead of
+    # splitting the whole document.
+    sample = ' '.join(islice((m.group(0) for m in _WORD_RE.finditer(text)), 3500))
 
     depth = {
         'beginner': (
@@ -462,21 +595,28 @@ def _generate_annotations(text: str, level: str) -> list:
         f'<document>\n{sample}\n</document>'
     )
 
+    cache_key = _cache_key(MODEL_ANNOTATE, prompt)
+    cached    = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         raw    = _call_haiku(prompt, max_tokens=1200)
-        raw    = re.sub(r'^```(?:json)?\s*', '', raw)
-        raw    = re.sub(r'\s*```$', '', raw)
-        match  = re.search(r'\[.*\]', raw, re.DOTALL)
-        if not match:
+        # Any ```json fence sits outside the brackets, so slicing first '[' to
+        # last ']' skips it — two linear scans, no greedy DOTALL backtracking
+        start, end = raw.find('['), raw.rfind(']')
+        if start == -1 or end < start:
             logger.warning('[Transform] No JSON array in annotation response')
             return []
-        parsed = json.loads(match.group(0))
-        valid_types = {'concept', 'formula', 'person', 'definition'}
-        return [
-            {**item, 'type': item['type'] if item['type'] in valid_types else 'concept'}
+        parsed = json.loads(raw[start:end + 1])
+        annotations = [
+            {**item, 'type': item['type'] if item['type'] in ANNOTATION_TYPES else 'concept'}
             for item in parsed
             if all(k in item for k in ('term', 'short', 'detail', 'type'))
         ]
+        if annotations:
+            _cache_put(cache_key, annotations)
+        return annotations
     except Exception as e:
         logger.warning(f'[Transform] Annotation generation failed: {e}')
         return []
@@ -488,8 +628,11 @@ def _generate_annotations(text: str, level: str) -> list:
 
 def _get_profile(user_id: str, doc_id: str) -> tuple:
     try:
-        resp   = _get_dynamodb().Table(TABLE).get_item(
-            Key={'user_id': user_id, 'doc_id': doc_id}
+        resp   = _get_table().get_item(
+            Key={'user_id': user_id, 'doc_id': doc_id},
+            # The item also carries annotations/self_answers — fetch only what's used
+            ProjectionExpression='#lvl, intent',
+            ExpressionAttributeNames={'#lvl': 'level'},
         )
         item   = resp.get('Item', {})
         return item.get('level', 'intermediate'), item.get('intent', 'studying')
@@ -499,7 +642,7 @@ def _get_profile(user_id: str, doc_id: str) -> tuple:
 
 
 def _update_dynamo_complete(user_id, doc_id, s3_key, annotations):
-    _get_dynamodb().Table(TABLE).update_item(
+    _get_table().update_item(
         Key={'user_id': user_id, 'doc_id': doc_id},
         UpdateExpression=(
             'SET transform_status = :status, s3_transformed_key = :key, '
@@ -516,7 +659,7 @@ def _update_dynamo_complete(user_id, doc_id, s3_key, annotations):
 
 def _update_dynamo_failed(user_id, doc_id, error):
     try:
-        _get_dynamodb().Table(TABLE).update_item(
+        _get_table().update_item(
             Key={'user_id': user_id, 'doc_id': doc_id},
             UpdateExpression='SET transform_status = :s, updated_at = :ts',
             ExpressionAttributeValues={
@@ -532,16 +675,70 @@ def _update_dynamo_failed(user_id, doc_id, error):
 # SECTION 7 — PUBLIC API
 # =============================================================================
 
+MAX_TOKENS = {'beginner': 2500, 'intermediate': 1500, 'expert': 900}   # beginner expands, expert condenses
+
+LEVEL_LABELS = {
+    'beginner':     'Beginner — Full explanations and examples added',
+    'intermediate': 'Intermediate — Balanced for moderate prior knowledge',
+    'expert':       'Expert — Condensed for professionals',
+}
+INTENT_LABELS = {
+    'studying':   'Study Mode',
+    'applying':   'Application Mode',
+    'explaining': 'Explain-to-Others Mode',
+    'exploring':  'Exploration Mode',
+}
+
+def _read_text(key: str) -> str:
+    return _get_s3().get_object(Bucket=BUCKET, Key=key)['Body'].read().decode('utf-8')
+
+
+def _rewrite_chunk(chunk: str, words: int, chunk_num: int, total_chunks: int,
+                   system_prompt: str, level: str, intent: str, max_tok: int) -> Optional[str]:
+    # Never raises — falls back to the original chunk so one bad call can't sink the document.
+    # Returns None instead when the breaker is open, so run can tell "Bedrock
+    # unreachable" apart from "rewrite rejected".
+    logger.info(f'[Transform] chunk {chunk_num}/{total_chunks} ({words} words)')
+    user_msg  = _build_user_message(chunk, chunk_num, total_chunks, level, intent)
+    cache_key = _cache_key(MODEL_TRANSFORM, system_prompt, user_msg, max_tok)
+    cached    = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+    try:
+        result = _call_bedrock(system_prompt, user_msg, max_tokens=max_tok)
+        if _valid(chunk, result, level):
+            _cache_put(cache_key, result)
+            return result
+        logger.warning(f'[Transform] chunk {chunk_num} failed validation — retrying')
+        result2 = _call_bedrock(system_prompt, user_msg,
+                                max_tokens=max_tok, temperature=0.8)
+        if _valid(chunk, result2, level):
+            _cache_put(cache_key, result2)
+            return result2
+        return chunk
+    except BedrockUnavailable:
+        logger.error(f'[Transform] chunk {chunk_num} skipped — Bedrock circuit open')
+        return None
+    except Exception as e:
+        logger.error(f'[Transform] Bedrock error chunk {chunk_num}: {e} — using original')
+        return chunk
+
+
 def run(user_id: str, filename: str, doc_id: str) -> dict:
     logger.info(f'[Transform] START  user={user_id}  file={filename}  doc={doc_id}')
+    # The worker threads below share these clients, and boto3 client creation
+    # is not thread-safe — build them all before any pool starts (no-op if warm)
+    warm()
 
-    level, intent = _get_profile(user_id, doc_id)
+    # The profile read and the S3 fetch are independent round-trips — overlap them.
+    extracted_key = f'extracted/{user_id}/{filename}.txt'
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        fetch         = pool.submit(_read_text, extracted_key)
+        level, intent = _get_profile(user_id, doc_id)
     logger.info(f'[Transform] level={level}  intent={intent}')
 
-    extracted_key = f'extracted/{user_id}/{filename}.txt'
     try:
-        obj  = _get_s3().get_object(Bucket=BUCKET, Key=extracted_key)
-        text = obj['Body'].read().decode('utf-8')
+        text = fetch.result()
     except Exception as e:
         _update_dynamo_failed(user_id, doc_id, str(e))
         raise ValueError(
@@ -553,55 +750,46 @@ def run(user_id: str, filename: str, doc_id: str) -> dict:
         _update_dynamo_failed(user_id, doc_id, 'empty extracted text')
         raise ValueError(f'Extracted text at {extracted_key} is empty.')
 
-    logger.info(f'[Transform] {len(text.split())} words to transform')
-
-    system_prompt = _build_system_prompt(level, intent)
+    system_prompt = (_SYSTEM_PROMPTS.get((level, intent))
+                     or _build_system_prompt(level, intent))
     chunks        = _chunk(text)
-    logger.info(f'[Transform] {len(chunks)} chunks')
-
-    max_tok = {'beginner': 2500, 'intermediate': 1500, 'expert': 900}.get(level, 1500)
-
-    rewritten_chunks = []
-    for i, chunk in enumerate(chunks):
-        logger.info(f'[Transform] chunk {i+1}/{len(chunks)} ({len(chunk.split())} words)')
-        user_msg = _build_user_message(chunk, i + 1, len(chunks), level, intent)
-        try:
-            result = _call_bedrock(system_prompt, user_msg, max_tokens=max_tok)
-            if _valid(chunk, result, level):
-                rewritten_chunks.append(result)
-            else:
-                logger.warning(f'[Transform] chunk {i+1} failed validation — retrying')
-                result2 = _call_bedrock(system_prompt, user_msg,
-                                        max_tokens=max_tok, temperature=0.8)
-                rewritten_chunks.append(result2 if _valid(chunk, result2, level) else chunk)
-        except Exception as e:
-            logger.error(f'[Transform] Bedrock error chunk {i+1}: {e} — using original')
-            rewritten_chunks.append(chunk)
-
-    level_labels = {
-        'beginner':     'Beginner — Full explanations and examples added',
-        'intermediate': 'Intermediate — Balanced for moderate prior knowledge',
-        'expert':       'Expert — Condensed for professionals',
-    }
-    intent_labels = {
-        'studying':   'Study Mode',
-        'applying':   'Application Mode',
-        'explaining': 'Explain-to-Others Mode',
-        'exploring':  'Exploration Mode',
-    }
+    logger.info(f'[Transform] {sum(n for _, n in chunks)} words to transform, {len(chunks)} chunks')
+
+    max_tok = MAX_TOKENS.get(level, 1500)
+
+    # Chunks and annotations are independent Bedrock round-trips — run them
+    # side by side. The annotation call gets its own worker so it overlaps the
+    # chunk rewrites instead of following them.
+    with ThreadPoolExecutor(max_workers=CHUNK_WORKERS + 1) as pool:
+        logger.info('[Transform] Generating annotations...')
+        annotations_future = pool.submit(_generate_annotations, text, level)
+        futures = [
+            pool.submit(_rewrite_chunk, chunk, words, i + 1, len(chunks),
+                        system_prompt, level, intent, max_tok)
+            for i, (chunk, words) in enumerate(chunks)
+        ]
+        rewritten_chunks = [f.result() for f in futures]
+        annotations      = annotations_future.result()
+    logger.info(f'[Transform] {len(annotations)} annotations')
+
+    # The breaker cut the run short and no chunk was rewritten — fail rather
+    # than save the original text as a complete transform
+    skipped          = sum(r is None for r in rewritten_chunks)
+    rewritten_chunks = [r if r is not None else chunk
+                        for r, (chunk, _) in zip(rewritten_chunks, chunks)]
+    if skipped and all(r == chunk for r, (chunk, _) in zip(rewritten_chunks, chunks)):
+        _update_dynamo_failed(user_id, doc_id, 'Bedrock unavailable (circuit open)')
+        raise BedrockUnavailable('Bedrock unavailable — no chunk could be transformed')
+
     header = (
         f'AKTE Personalised Document\n'
-        f'Level:  {level_labels.get(level, level)}\n'
-        f'Intent: {intent_labels.get(intent, intent)}\n'
+        f'Level:  {LEVEL_LABELS.get(level, level)}\n'
+        f'Intent: {INTENT_LABELS.get(intent, intent)}\n'
         f'Generated: {datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")}\n'
         f'{"=" * 60}\n\n'
     )
     full_output = header + '\n\n'.join(rewritten_chunks)
 
-    logger.info('[Transform] Generating annotations...')
-    annotations = _generate_annotations(text, level)
-    logger.info(f'[Transform] {len(annotations)} annotations')
-
     output_key = f'outputs/{user_id}/{filename}_transformed.txt'
     try:
         _get_s3().put_object(